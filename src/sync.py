@@ -16,24 +16,159 @@ Create any directories that are present in the remote and not present in the loc
 Compare all files in remote to corresponding local files.
     If the remote file is not present at the local location, add to download queue.
     If the remote file size is different, add to download queue (overwrite).
-    If the remote file modify date is newer than the local file, add to the download queue
-      (overwrite).
+    With --strict, if the remote file modify date is newer than the local file, add to the
+      download queue (overwrite). Otherwise a file of the same size is assumed unchanged.
 """
 
 import re
 import os
 import sys
 import json
+import queue
+import atexit
+import asyncio
+import time
 import logging
+import logging.handlers
 import argparse
+import shutil
+import signal
+import tempfile
 import datetime
+import functools
 import subprocess
-from typing import TextIO, Self, List, Dict
-from platform import system
+import concurrent.futures
+from array import array
+from operator import attrgetter
+from dataclasses import dataclass
+from typing import TextIO, Self, List, Dict, Iterable, Iterator, Tuple, Any
+
+try:
+    import orjson  # Optional: faster (de)serialization of the listing cache.
+except ImportError:
+    orjson = None
+
+# One node line of "mega-ls -l --time-format=ISO6081_WITH_TIME":
+#   FLAGS VERSION SIZE DATE NAME (e.g. "-ep-    1      12345 2023-01-31T12:00:00 file.stl")
+LS_NODE_PATTERN = re.compile(' '.join([
+    r"^([bdirx-])([e-])([pt-])([is-])",  # Flags (type, export, export duration, shared)
+    r" {0,3}([\d-]+)",  # Version
+    r" {0,9}([\d-]+)",  # Size
+    r"(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})",  # Date
+    r"(.*)$",  # Name
+]))
+
+# Folder header of "mega-ls -lr" (e.g. "/Root/sub dir:").
+LS_FOLDER_PATTERN = re.compile(''.join([
+    r"((?<=^\/).*?(?=[\/(:)]))",  # Base folder (redundant; name of the remoteRoot)
+    r"\/?",  # First slash in the path, marking the end of the root name.
+    r"((?!=\/).*(?=:))",  # Relative path to the remoteRoot provided (folder path).
+]))
+
+# Echoed after each command sent to a MEGAcmd shell to mark the end of the command's output.
+SHELL_SENTINEL = "__MEGA_SYNC_DONE__"
+# MEGAcmd reports failures in its output as e.g. "[API:err: 12:00:00] Couldn't find ...", at the
+# start of a line or right after the shell prompt ("MEGA CMD> [API:err: ...").
+SHELL_ERROR_PATTERN = re.compile(r"^(?:[^\[\]]*> )?\[[^\]]*err")
+
+# MEGAcmd error codes and their messages (SDK API errors, then MEGAcmd's own codes).
+MEGA_ERROR_CODES = {
+    0: "Everything OK",
+    -1: "Internal error",
+    -2: "Invalid argument",
+    -3: "Request failed, retrying",
+    -4: "Rate limit exceeded",
+    -5: "Failed permanently",
+    -6: "Too many concurrent connections or transfers",
+    -7: "Out of range",
+    -8: "Expired",
+    -9: "Not found",
+    -10: "Circular linkage detected",
+    -11: "Access denied",
+    -12: "Already exists",
+    -13: "Incomplete",
+    -14: "Invalid key/Decryption error",
+    -15: "Bad session ID",
+    -16: "Blocked",
+    -17: "Over quota",
+    -18: "Temporarily not available",
+    -19: "Connection overflow",
+    -20: "Write error",
+    -21: "Read error",
+    -22: "Invalid application key",
+    -23: "SSL verification failed",
+    -24: "Not enough quota",
+    -26: "Multi-factor authentication required",
+    -51: "Wrong arguments",
+    -52: "Invalid email",
+    -53: "Resource not found",
+    -54: "Invalid state",
+    -55: "Invalid type",
+    -56: "Operation not allowed",
+    -57: "Needs logging in",
+    -58: "Nodes not fetched",
+    -59: "Unexpected failure",
+    -60: "Confirmation required",
+    -61: "String required",
+    -62: "Partial output provided",
+    -71: "Restart required",
+}
+
+# First character (type flag) of every mega-ls node line.
+NODE_TYPES = frozenset('bdirx-')
+
+# Seconds a local mtime may trail the remote date and still count as current. FAT stores mtimes
+# with 2 s resolution and the remote dates are whole seconds.
+MTIME_TOLERANCE = 2
+
+# Node type flags as stored in RemoteTree.types.
+TYPE_FOLDER = ord('d')
+TYPE_FILE = ord('-')
+
+
+@functools.lru_cache(maxsize=4096)
+def parseMegaDate(date: str) -> int:
+    """Convert a mega-ls ISO6081_WITH_TIME date (local time) to integer epoch seconds.
+
+    Files uploaded together share timestamps, so results are memoized; the local-time conversion
+    in datetime.timestamp costs more than the (C-level) fromisoformat parse itself.
+    """
+    return int(datetime.datetime.fromisoformat(date).timestamp())
+
+
+def isShellError(line: str) -> bool:
+    """Check whether a line of MEGAcmd shell output reports an error, with or without a prompt."""
+    return SHELL_ERROR_PATTERN.match(line) is not None
+
+
+def megaErrorMeaning(code: int) -> str:
+    """Translate a MEGAcmd process's returncode into its message, as mega-errorcode would.
+
+    MEGAcmd exits with negative codes, which POSIX reports modulo 256 and Windows as an unsigned
+    32-bit value, so the status is folded back to its signed value before the lookup. A negative
+    returncode never comes from a normal exit: subprocess and asyncio use -N for a process killed
+    by signal N.
+    """
+    if code < 0:
+        try:
+            return f"Killed by signal {signal.Signals(-code).name}"
+        except ValueError:
+            return f"Killed by signal {-code}"
+    if code > 127:
+        code -= 256 if code < 256 else 1 << 32
+    return MEGA_ERROR_CODES.get(code, f"Unknown MEGA error {code}")
 
 
 class DualLogger():
-    """Send logging messages to both the specified file and the stderr of the CLI application."""
+    """Send logging messages to both the specified file and the stderr of the CLI application.
+
+    Records are queued by the logging call and written by a background listener thread, so the
+    callers (including the listing and download workers) never block on the file or terminal.
+    """
+    # The active instance's queue handler and listener; at most one is attached to the root logger.
+    queueHandler = None
+    listener = None
+
     def __init__(
         self: Self,
         filename: str,
@@ -51,21 +186,42 @@ class DualLogger():
         rootLogger = logging.getLogger()
         rootLogger.setLevel(min(fileLevel, streamLevel))
 
+        # Replace the handlers of an earlier DualLogger instead of stacking another set.
+        self.stop()
+
         # Make the log directory if it doesn't exist yet.
-        if not os.path.exists(os.path.dirname(filename)):
-            os.makedirs(os.path.dirname(filename))
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
 
         # Start the to-file logging.
         fileHandler = logging.FileHandler(filename=filename, encoding=encoding)
         fileHandler.setFormatter(msgFormatter)
         fileHandler.setLevel(fileLevel)
-        rootLogger.addHandler(fileHandler)
 
         # Start the to-terminal logging.
         consoleHandler = logging.StreamHandler(stream=stream)
         consoleHandler.setFormatter(msgFormatter)
         consoleHandler.setLevel(streamLevel)
-        rootLogger.addHandler(consoleHandler)
+
+        # Hand records to both handlers through a queue serviced by one listener thread.
+        logQueue = queue.SimpleQueue()
+        DualLogger.queueHandler = logging.handlers.QueueHandler(logQueue)
+        DualLogger.listener = logging.handlers.QueueListener(
+            logQueue, fileHandler, consoleHandler, respect_handler_level=True)
+        rootLogger.addHandler(DualLogger.queueHandler)
+        DualLogger.listener.start()
+
+    @staticmethod
+    def stop() -> None:
+        """Flush the queued records, then detach and close the handlers."""
+        if DualLogger.listener is None:
+            return
+
+        DualLogger.listener.stop()
+        logging.getLogger().removeHandler(DualLogger.queueHandler)
+        for handler in DualLogger.listener.handlers:
+            handler.close()
+        DualLogger.queueHandler = None
+        DualLogger.listener = None
 
     def testLogger(self: Self) -> None:
         logging.critical("DualLogger test message (critical)")
@@ -75,26 +231,199 @@ class DualLogger():
         logging.debug("DualLogger test message (debug)")
 
 
+# Flush queued records at exit; registered once, and a no-op when no DualLogger is active.
+atexit.register(DualLogger.stop)
+
+
+@dataclass(slots=True)
+class Node():
+    """One remote node as listed by mega-ls."""
+    type: str
+    size: int
+    date: int
+    name: str
+    path: str
+    export: str = '-'
+    export_duration: str = '-'
+    shared: str = '-'
+    version: int = 0
+
+    def toDict(self: Self) -> Dict[str, Any]:
+        """Return the node's fields as a dict (for JSON serialization)."""
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class RemoteTree():
+    """Remote nodes stored as parallel arrays, so scanning the tree avoids an object per node."""
+    __slots__ = ('paths', 'types', 'sizes', 'dates', 'exports', 'exportDurations', 'shares',
+                 'versions')
+
+    def __init__(
+        self: Self,
+        nodes: Iterable[Node] = (),
+    ):
+        self.paths = []
+        self.types = bytearray()
+        self.sizes = array('q')
+        self.dates = array('q')
+        # Flag characters and versions, only needed to rebuild full nodes.
+        self.exports = bytearray()
+        self.exportDurations = bytearray()
+        self.shares = bytearray()
+        self.versions = array('q')
+
+        for node in nodes:
+            self.append(node)
+
+    def __len__(self: Self) -> int:
+        return len(self.paths)
+
+    @staticmethod
+    def depthFirst(
+        nodes: List[Node],
+    ) -> List[Node]:
+        """
+        depthFirst Order nodes so every folder's contents directly follow the folder itself.
+
+        Only each folder's own entries are sorted (by name); the full order is then assembled by
+        walking the folders depth first, which avoids sorting the whole tree by path.
+
+        Parameters
+        ----------
+        nodes : List[Node]
+            Nodes as returned by the ls methods, in any order.
+
+        Returns
+        -------
+        List[Node]
+            The same nodes, ordered by path component.
+        """
+        children = {}
+        for node in nodes:
+            children.setdefault(node.path.rpartition('/')[0], []).append(node)
+        for siblings in children.values():
+            siblings.sort(key=attrgetter('name'))
+
+        # Each folder's entries are popped as they are visited, so sibling folders sharing a name
+        # (MEGA allows this) do not repeat them, and whatever is left over has no listed folder.
+        ordered = []
+        stack = [iter(children.pop("", ()))]
+        while stack:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+                continue
+
+            ordered.append(node)
+            if node.type == 'd' and node.path in children:
+                stack.append(iter(children.pop(node.path)))
+
+        if children:
+            # Some nodes' folders were not listed; fall back to sorting everything by path.
+            orphans = sum(len(siblings) for siblings in children.values())
+            logging.warning(f"{orphans} remote nodes have no listed folder.")
+            return sorted(nodes, key=lambda n: n.path.split('/'))
+
+        return ordered
+
+    def append(
+        self: Self,
+        node: Node,
+    ) -> None:
+        """
+        append Add a parsed mega-ls node to the end of the tree.
+
+        Parameters
+        ----------
+        node : Node
+            Node as returned by the ls methods.
+        """
+        self.paths.append(node.path)
+        self.types.append(ord(node.type))
+        self.sizes.append(node.size)
+        self.dates.append(int(node.date))
+        self.exports.append(ord(node.export))
+        self.exportDurations.append(ord(node.export_duration))
+        self.shares.append(ord(node.shared))
+        self.versions.append(node.version)
+
+    def node(
+        self: Self,
+        i: int,
+    ) -> Node:
+        """
+        node Rebuild the node at index i.
+
+        Parameters
+        ----------
+        i : int
+            Index of the node in the tree.
+
+        Returns
+        -------
+        Node
+            The node with all of its mega-ls fields.
+        """
+        return Node(
+            type=chr(self.types[i]),
+            size=self.sizes[i],
+            date=self.dates[i],
+            name=self.paths[i].rpartition('/')[2],
+            path=self.paths[i],
+            export=chr(self.exports[i]),
+            export_duration=chr(self.exportDurations[i]),
+            shared=chr(self.shares[i]),
+            version=self.versions[i],
+        )
+
+
 class MEGAsync():
 
     def __init__(
         self: Self,
         folder_url: str,
         dest_path: str,
+        maxDownloads: int = 6,
+        maxListings: int = 0,
+        cacheTTL: float = 3600,
+        cacheSize: int = 10000,
+        batchDownloads: bool = False,
+        maxScanners: int = 16,
+        persistentShell: bool = False,
+        strictMtime: bool = False,
     ):
+        if maxDownloads < 1:
+            raise ValueError(f"maxDownloads must be at least 1, got {maxDownloads}")
+        if maxListings < 0:
+            raise ValueError(f"maxListings must be at least 0, got {maxListings}")
+
         self.remoteRoot = folder_url
         self.localRoot = dest_path
-
-        # OS-specific shell call.
-        if system() == "Windows":
-            logging.debug("Running Windows; Shell: PowerShell")
-            self.OSShell = "PowerShell"
-        else:
-            msg = f"Not suppoted for OS: {system()}"
-            logging.critical(msg)
-            raise NotImplementedError(msg)
-
-        self.tree = []
+        self.maxDownloads = maxDownloads  # Concurrent MEGA-GET processes.
+        self.maxListings = maxListings  # Concurrent MEGA-LS processes (0: one recursive listing).
+        self.cacheTTL = cacheTTL  # Seconds a cached MEGA-LS listing stays valid (0: no cache).
+        self.cacheSize = cacheSize  # Maximum number of cached listings.
+        self.batchDownloads = batchDownloads  # Send all gets through one MEGAcmd shell.
+        self.maxScanners = maxScanners  # Threads scanning local directories.
+        self.persistentShell = persistentShell  # Concurrent listings reuse one shell per worker.
+        self.cachePath = os.path.join(self.localRoot, ".mega_cache", "ls.json")
+        self.cache = {}
+        self.strictMtime = strictMtime  # Also replace same-size files when the remote is newer.
+
+        # Resolve the MEGAcmd executables once so they can be called without a shell.
+        self.megaCmd = {}
+        for name in ["mega-login", "mega-logout", "mega-cd", "mega-ls", "mega-get", "mega-cmd"]:
+            cmdPath = shutil.which(name)
+            if cmdPath is None:
+                logging.warning(f"Unable to locate {name} on the PATH.")
+                cmdPath = name
+            logging.debug(f"Using {cmdPath} for {name}")
+            self.megaCmd[name] = cmdPath
+
+        self.tree = RemoteTree()
+        self.localIndex = {}
+        self.localDirs = set()
+        self.localTargets = {}
         self.downloadNodes = []
         self.replaceNodes = []
 
@@ -116,28 +445,28 @@ class MEGAsync():
 
         # Log in to the remotepath.
         logging.info("Logging in to remote path.")
-        cmd = [self.OSShell, "mega-login", self.remoteRoot]
+        cmd = [self.megaCmd["mega-login"], self.remoteRoot]
         logging.debug(' '.join(cmd))
         pLogin = subprocess.run(cmd, capture_output=True)
 
         if pLogin.stdout:
-            logging.debug(pLogin.stdout.decode('utf-8').rstrip())
+            logging.debug(pLogin.stdout.decode('utf-8', 'replace').rstrip())
         if pLogin.stderr:
-            logging.error(pLogin.stderr.decode('utf-8').rstrip())
+            logging.error(pLogin.stderr.decode('utf-8', 'replace').rstrip())
 
-        cmd = [self.OSShell, "mega-cd", "/"]
+        cmd = [self.megaCmd["mega-cd"], "/"]
         logging.debug(' '.join(cmd))
         pCD = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
 
         if pCD.stdout:
-            logging.error(pCD.stdout.decode('utf-8').rstrip())
+            logging.error(pCD.stdout.decode('utf-8', 'replace').rstrip())
 
         return pLogin.returncode
 
     def ls(
         self: Self,
         path: str,
-    ) -> List[Dict[str, str]]:
+    ) -> Iterator[Node]:
         """
         ls Run the mega-ls command for the given node.
 
@@ -146,82 +475,264 @@ class MEGAsync():
         path : str
             Path to the desired directory relative to the remote URL provided.
 
+        Yields
+        ------
+        Node
+            Each node present within the path, as soon as mega-ls prints it.
+
+        Raises
+        ------
+        OSError
+            If the mega-ls call returns a non-zero return code, that code is sent up the stack as
+            an OSError Exception once the output is exhausted. The path that caused the mega-ls
+            issue is included as the filename.
+        """
+        nodes = self.cacheGet(path)
+        if nodes is not None:
+            yield from nodes
+            return
+
+        # command: mega-ls -l $remote_path --time-format=ISO6081_WITH_TIME
+        cmd = [self.megaCmd["mega-ls"], "-l", path, "--time-format=ISO6081_WITH_TIME"]
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(' '.join(cmd))
+
+        # Hand each node to the caller as mega-ls writes it; only keep them if they are cached.
+        # stderr goes to a temporary file: an undrained pipe would stall mega-ls once it filled.
+        nodes = [] if self.cacheTTL else None
+        with (tempfile.TemporaryFile() as errFile,
+              subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errFile,
+                               encoding='utf-8') as pLS):
+            for line in pLS.stdout:
+                node = self.parseLsLine(path, line)
+                if node is not None:
+                    if nodes is not None:
+                        nodes.append(node)
+                    yield node
+            pLS.wait()
+            errFile.seek(0)
+            stderr = errFile.read().decode('utf-8', 'replace')
+
+        if stderr:
+            logging.error(stderr.rstrip())
+        if pLS.returncode != 0:
+            raise OSError(pLS.returncode, "MEGA-LS failed", path)
+
+        if nodes is not None:
+            self.cachePut(path, nodes)
+
+    async def lsAsync(
+        self: Self,
+        path: str,
+        shell: asyncio.subprocess.Process | None = None,
+    ) -> List[Node]:
+        """
+        lsAsync Run the mega-ls command for the given node without blocking the event loop.
+
+        Parameters
+        ----------
+        path : str
+            Path to the desired directory relative to the remote URL provided.
+        shell : asyncio.subprocess.Process | None, optional
+            MEGAcmd shell (see openShell) to run the listing in instead of starting a new
+            mega-ls process, by default None.
+
         Returns
         -------
-        List[Dict[str, str]]
+        List[Node]
             All nodes present within the path.
 
         Raises
         ------
         OSError
-            If the mega-ls call returns a non-zero return code, that code is sent up the stack as
-            an OSError Exception. The path that caused the mega-ls issue is included as the
-            filename.
+            If the mega-ls call returns a non-zero return code (see ls).
         """
-        nodes = []
+        nodes = self.cacheGet(path)
+        if nodes is not None:
+            return nodes
+
+        if shell is not None:
+            # The MEGAcmd shell splits its input itself, so paths are quoted for it here.
+            lines = await self.shellCommand(
+                shell, f'ls -l "{path}" --time-format=ISO6081_WITH_TIME')
+            nodes = []
+            for line in lines:
+                # Node lines are checked first: a file name may itself look like an error.
+                node = self.parseLsLine(path, line)
+                if node is not None:
+                    nodes.append(node)
+                elif isShellError(line):
+                    raise OSError(1, line, path)
+
+            self.cachePut(path, nodes)
+            return nodes
+
         # command: mega-ls -l $remote_path --time-format=ISO6081_WITH_TIME
-        cmd = [self.OSShell, "mega-ls", "-l",
-               ''.join(['"', path, '"']),
-               "--time-format=ISO6081_WITH_TIME"]
+        cmd = [self.megaCmd["mega-ls"], "-l", path, "--time-format=ISO6081_WITH_TIME"]
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(' '.join(cmd))
+        pLS = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+
+        # Parse the listing line by line as mega-ls writes it.
+        nodes = []
+        async for line in pLS.stdout:
+            node = self.parseLsLine(path, line.decode('utf-8'))
+            if node is not None:
+                nodes.append(node)
+        stderr = await pLS.stderr.read()
+        await pLS.wait()
+
+        if stderr:
+            logging.error(stderr.decode('utf-8', 'replace').rstrip())
+        if pLS.returncode != 0:
+            raise OSError(pLS.returncode, "MEGA-LS failed", path)
+
+        self.cachePut(path, nodes)
+
+        return nodes
+
+    async def openShell(
+        self: Self,
+    ) -> asyncio.subprocess.Process:
+        """
+        openShell Start an interactive MEGAcmd shell that commands can be piped to.
+
+        Returns
+        -------
+        asyncio.subprocess.Process
+            The running shell.
+        """
+        cmd = [self.megaCmd["mega-cmd"]]
         logging.debug(' '.join(cmd))
-        pLS = subprocess.run(cmd, capture_output=True)
+        return await asyncio.create_subprocess_exec(
+            *cmd, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT)
 
-        # logging.debug(pLS.stdout.decode('utf-8').rstrip())
-        if pLS.stderr:
-            for line in pLS.stderr.decode('utf-8').rstrip():
-                logging.error(line)
+    async def closeShell(
+        self: Self,
+        shell: asyncio.subprocess.Process,
+    ) -> None:
+        """
+        closeShell End a MEGAcmd shell session; the MEGAcmd server keeps running.
 
-        if pLS.returncode != 0:
-            logging.error(pLS.stdout.decode('utf-8').rstrip())
+        Parameters
+        ----------
+        shell : asyncio.subprocess.Process
+            Shell started by openShell.
+        """
+        if not shell.stdin.is_closing():
+            shell.stdin.close()
+        await shell.wait()
+
+    async def shellCommand(
+        self: Self,
+        shell: asyncio.subprocess.Process,
+        command: str,
+    ) -> List[str]:
+        """
+        shellCommand Run one command in a MEGAcmd shell and collect its output.
 
-        for line in pLS.stdout.decode('utf-8').split('\n'):
-            # Skip the lines that are not formatted correctly.
-            patternNode = r"^([bdirx-][e-][pt-][is-])( {1,4}[\d-])( {1,10}[\d-]+)"
-            if not re.match(patternNode, line):
-                logging.debug(f"Skipping line {line.rstrip()}")
+        Parameters
+        ----------
+        shell : asyncio.subprocess.Process
+            Shell started by openShell.
+        command : str
+            Command line as typed at the MEGAcmd prompt (arguments quoted as needed).
+
+        Returns
+        -------
+        List[str]
+            Lines of output written by the command.
+
+        Raises
+        ------
+        OSError
+            If the shell exits before the command's output ends.
+        """
+        logging.debug(command)
+        echoSentinel = ' '.join(["echo", SHELL_SENTINEL])
+        shell.stdin.write(''.join([command, '\n', echoSentinel, '\n']).encode('utf-8'))
+        await shell.stdin.drain()
+
+        lines = []
+        while True:
+            rawLine = await shell.stdout.readline()
+            if not rawLine:
+                # Reap the shell so its returncode is set for the callers checking it.
+                await shell.wait()
+                raise OSError(shell.returncode, "MEGAcmd shell exited", command)
+
+            line = rawLine.decode('utf-8').rstrip()
+            # The output may follow the shell prompt on the same line; skip any echo of the
+            # sentinel command itself.
+            if line.endswith(echoSentinel):
                 continue
+            if line.endswith(SHELL_SENTINEL):
+                return lines
+            lines.append(line)
 
-            logging.debug(f"Parsing line: {line.rstrip()}")
-            type = line[0]
-            export = line[1]
-            exportDuration = line[2]
-            shared = line[3]
-            version = line[5:9].lstrip()
-            size = line[10:20].lstrip()
-            date = datetime.datetime.strptime(line[21:40].strip(), "%Y-%m-%dT%H:%M:%S").timestamp()
-            name = line[41:].rstrip()
-            nodePath = '/'.join([path, name]).lstrip("/\\")
-
-            # Sanitize input.
-            if version == "-":
-                version = 0
-            else:
-                version = int(version)
-            if size == "-":
-                size = 0
-            else:
-                size = int(size)
-
-            node = {
-                "type": type,
-                "export": export,
-                "export_duration": exportDuration,
-                "shared": shared,
-                "version": version,
-                "size": size,
-                "date": date,
-                "name": name,
-                "path": nodePath,
-            }
+    def parseLsLine(
+        self: Self,
+        path: str,
+        line: str,
+    ) -> Node | None:
+        """
+        parseLsLine Parse one node line of a mega-ls call into a node.
+
+        Parameters
+        ----------
+        path : str
+            Path of the directory that was listed, relative to the remote URL provided.
+        line : str
+            Line of output from the mega-ls call.
+
+        Returns
+        -------
+        Node | None
+            The node described by the line, or None if the line is not a node.
+        """
+        # Skip the lines that are not formatted correctly. Headers, blank lines and folder lines
+        # are rejected on their first character before running the regex.
+        # This runs once per listed line, so only build debug messages when they will be emitted.
+        isDebug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        nodeMatch = line[:1] in NODE_TYPES and LS_NODE_PATTERN.match(line)
+        if not nodeMatch:
+            if isDebug:
+                logging.debug("Skipping line %s", line.rstrip())
+            return None
+
+        if isDebug:
+            logging.debug("Parsing line: %s", line.rstrip())
+        type, export, exportDuration, shared, version, size, date, name = nodeMatch.groups()
+        date = parseMegaDate(date)
+        name = name.rstrip()
+        nodePath = '/'.join([path, name]).lstrip("/\\")
+
+        # Sanitize input.
+        version = 0 if version == "-" else int(version)
+        size = 0 if size == "-" else int(size)
+
+        node = Node(
+            type=type,
+            export=export,
+            export_duration=exportDuration,
+            shared=shared,
+            version=version,
+            size=size,
+            date=date,
+            name=name,
+            path=nodePath,
+        )
+        if isDebug:
             logging.debug(node)
-            nodes.append(node)
 
-        return nodes
+        return node
 
     def lsRecursive(
         self: Self,
         path: str,
-    ) -> List[Dict[str, str]]:
+    ) -> List[Node]:
         """
         lsRecursive Run the mega-ls command for the given node with the recursive flag enabled.
 
@@ -233,84 +744,169 @@ class MEGAsync():
 
         Returns
         -------
-        List[Dict[str, str]]
+        List[Node]
             All nodes present within the path.
         """
+        cacheKey = ''.join(["-r ", path])
+        nodes = self.cacheGet(cacheKey)
+        if nodes is not None:
+            return nodes
+
         nodes = []
         remoteDir = ""  # Path of the current remote node relative to the remotePath supplied.
         # command: mega-ls -lr $remote_path --time-format=ISO6081_WITH_TIME
-        cmd = [self.OSShell, "mega-ls", "-lr",
-               ''.join(['"', path, '"']), "--time-format=ISO6081_WITH_TIME"]
+        cmd = [self.megaCmd["mega-ls"], "-lr", path, "--time-format=ISO6081_WITH_TIME"]
         logging.debug(' '.join(cmd))
-        pLS = subprocess.run(cmd, capture_output=True)
-
-        if pLS.stderr:
-            for line in pLS.stderr.decode('utf-8').rstrip():
-                logging.error(line)
+        # stderr goes to a temporary file: an undrained pipe would stall mega-ls once it filled.
+        with (tempfile.TemporaryFile() as errFile,
+              subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errFile,
+                               encoding='utf-8') as pLS):
+            # Parse the listing line by line as mega-ls writes it.
+            for line in pLS.stdout:
+                # Folder headers ("/Root/sub dir:") are the only lines starting with a slash, so
+                # node lines never reach the folder regex.
+                folderMatch = line[:1] == '/' and LS_FOLDER_PATTERN.search(line)
+                if folderMatch:
+                    # Start of a new remote directory.
+                    remoteDir = folderMatch[2]
+                    logging.debug("Parsing directory: %s", remoteDir)
+                else:
+                    # Add a new node to the list with the current remoteDir.
+                    node = self.parseLsLine(remoteDir, line)
+                    if node is not None:
+                        nodes.append(node)
+
+            pLS.wait()
+            errFile.seek(0)
+            stderr = errFile.read().decode('utf-8', 'replace')
+        if stderr:
+            logging.error(stderr.rstrip())
         if pLS.returncode != 0:
-            logging.error(pLS.stdout.decode('utf-8').rstrip())
-
-        folderPattern = ''.join([
-            r"((?<=^\/).*?(?=[\/(:)]))",  # Base folder (redundant; name of the remoteRoot)
-            r"\/?",  # First slash in the path, marking the end of the root name.
-            r"((?!=\/).*(?=:))",  # Relative path to the remoteRoot provided (folder path).
-        ])
-        nodePattern = ' '.join([
-            r"^([bdirx-][e-][pt-][is-])",  # Flags
-            r"( {0,3}[\d-])",  # Version
-            r"( {0,9}[\d-]+)",  # Size
-            r"(\d{4}(-\d{2}){2}T\d{2}(:\d{2}){2})",  # Date
-            r"(.*)",  # Name
-        ])
+            logging.error(f"MEGA-LS failed with error code {pLS.returncode}")
+            return nodes
 
-        for line in pLS.stdout.decode('utf-8').split('\n'):
-            folderMatch = re.search(folderPattern, line)
-            if folderMatch:
-                # Start of a new remote directory.
-                remoteDir = folderMatch[2]
-                logging.debug(f"Parsing directory: {remoteDir}")
-            else:
-                nodeMatch = re.search(nodePattern, line)
-                if nodeMatch:
-                    # Add a new node to the list with the current remoteDir.
-                    # Parse the line of text from the output.
-                    flags = nodeMatch[1]
-                    type = flags[0]
-                    export = flags[1]
-                    exportDuration = flags[2]
-                    shared = flags[3]
-                    version = nodeMatch[2].strip()
-                    size = nodeMatch[3].strip()
-                    date = datetime.datetime.strptime(nodeMatch[4], "%Y-%m-%dT%H:%M:%S").timestamp()
-                    name = nodeMatch[7].rstrip('\r')
-                    nodePath = '/'.join([remoteDir, name]).strip(r'\/')
-
-                    # Sanitize input.
-                    if version == "-":
-                        version = 0
-                    else:
-                        version = int(version)
-                    if size == "-":
-                        size = 0
-                    else:
-                        size = int(size)
-
-                    node = {
-                        "type": type,
-                        "export": export,
-                        "export_duration": exportDuration,
-                        "shared": shared,
-                        "version": version,
-                        "size": size,
-                        "date": date,
-                        "name": name,
-                        "path": nodePath,
-                    }
-                    logging.debug(f"Parsing node: {node['path']}")
-                    nodes.append(node)
+        self.cachePut(cacheKey, nodes)
 
         return nodes
 
+    def loadCache(
+        self: Self,
+    ) -> int:
+        """
+        loadCache Read the persisted MEGA-LS listings from disk.
+
+        Returns
+        -------
+        int
+            Number of cached listings loaded.
+        """
+        self.cache = {}
+        if not self.cacheTTL or not os.path.exists(self.cachePath):
+            return 0
+
+        try:
+            with open(self.cachePath, 'rb') as f:
+                data = f.read()
+            stored = orjson.loads(data) if orjson else json.loads(data)
+            if not isinstance(stored, dict):
+                raise ValueError(f"expected an object, got {type(stored).__name__}")
+            # Listings are keyed by paths relative to the remote folder, so they are only valid for
+            # the folder they were taken from.
+            if stored.get('remoteRoot') != self.remoteRoot:
+                logging.info(f"Ignoring listing cache of remote folder {stored.get('remoteRoot')}")
+                return 0
+            cache = stored.get('listings')
+            if not isinstance(cache, dict):
+                raise ValueError("missing listings")
+            for key, entry in cache.items():
+                if not (isinstance(entry, dict) and isinstance(entry.get('ts'), (int, float))
+                        and isinstance(entry.get('nodes'), list)
+                        and all(isinstance(node, dict) for node in entry['nodes'])):
+                    raise ValueError(f"malformed entry for {key!r}")
+            self.cache = cache
+        except (OSError, ValueError, TypeError) as e:
+            logging.warning(f"Ignoring unreadable listing cache {self.cachePath}: {e}")
+            self.cache = {}
+
+        logging.debug(f"Loaded {len(self.cache)} cached listings.")
+        return len(self.cache)
+
+    def saveCache(
+        self: Self,
+    ) -> None:
+        """
+        saveCache Persist the MEGA-LS listings to disk, dropping the least recently used ones.
+        """
+        if not self.cacheTTL:
+            return
+
+        # Dictionaries keep insertion order and cacheGet re-inserts on a hit, so the oldest
+        # entries are at the front.
+        for key in list(self.cache)[:max(0, len(self.cache) - self.cacheSize)]:
+            del self.cache[key]
+
+        stored = {"remoteRoot": self.remoteRoot, "listings": self.cache}
+        if orjson:
+            data = orjson.dumps(stored)
+        else:
+            data = json.dumps(stored, default=Node.toDict).encode('utf-8')
+
+        os.makedirs(os.path.dirname(self.cachePath), exist_ok=True)
+        with open(self.cachePath, 'wb') as f:
+            f.write(data)
+
+    def cacheGet(
+        self: Self,
+        key: str,
+    ) -> List[Node] | None:
+        """
+        cacheGet Look up a MEGA-LS listing that is younger than the cache TTL.
+
+        Parameters
+        ----------
+        key : str
+            Remote path of the listing.
+
+        Returns
+        -------
+        List[Node] | None
+            The cached nodes, or None on a miss.
+        """
+        entry = self.cache.pop(key, None)
+        if entry is None or time.time() - entry['ts'] >= self.cacheTTL:
+            return None
+
+        logging.debug("Listing cache hit: %s", key)
+        self.cache[key] = entry
+        # Entries loaded from disk are plain dicts; convert them once, on first use.
+        if entry['nodes'] and isinstance(entry['nodes'][0], dict):
+            try:
+                entry['nodes'] = [Node(**node) for node in entry['nodes']]
+            except TypeError as e:
+                logging.warning(f"Dropping malformed cached listing {key}: {e}")
+                del self.cache[key]
+                return None
+        return entry['nodes']
+
+    def cachePut(
+        self: Self,
+        key: str,
+        nodes: List[Node],
+    ) -> None:
+        """
+        cachePut Store a MEGA-LS listing.
+
+        Parameters
+        ----------
+        key : str
+            Remote path of the listing.
+        nodes : List[Node]
+            Nodes returned for the listing.
+        """
+        if self.cacheTTL:
+            self.cache.pop(key, None)
+            self.cache[key] = {"ts": time.time(), "nodes": nodes}
+
     def getRemoteTree(
         self: Self,
     ) -> int:
@@ -322,12 +918,82 @@ class MEGAsync():
         int
             Number of nodes found.
         """
-        # Parse the output of a single call of "mega-ls -lr / --time-format=ISO6081_WITH_TIME".
-        nodes = self.lsRecursive('/')
-        self.tree = sorted(nodes, key=lambda n: n['path'])
+        self.loadCache()
+
+        if self.maxListings:
+            # Walk the remote breadth-first with a pool of concurrent "mega-ls -l" calls.
+            nodes = asyncio.run(self.lsConcurrent('/'))
+        else:
+            # Parse the output of a single call of "mega-ls -lr / --time-format=ISO6081_WITH_TIME".
+            nodes = self.lsRecursive('/')
+        self.tree = RemoteTree(RemoteTree.depthFirst(nodes))
+
+        self.saveCache()
 
         return len(self.tree)
 
+    async def lsConcurrent(
+        self: Self,
+        path: str,
+    ) -> List[Node]:
+        """
+        lsConcurrent List the remote tree below path breadth-first with concurrent mega-ls calls.
+
+        Parameters
+        ----------
+        path : str
+            Path to the desired directory relative to the remote URL provided.
+            Note: The value '/' is the remoteRoot directory itself.
+
+        Returns
+        -------
+        List[Node]
+            All nodes present within the path (recursively).
+        """
+        pending = asyncio.Queue()
+        results = [[] for _ in range(self.maxListings)]
+
+        async def worker(
+            found: List[Node],
+        ) -> None:
+            # Each worker reuses one MEGAcmd shell for all its listings if persistentShell is set.
+            shell = await self.openShell() if self.persistentShell else None
+            try:
+                while True:
+                    dirPath = await pending.get()
+                    try:
+                        for node in await self.lsAsync(dirPath, shell):
+                            found.append(node)
+                            if node.type == 'd':
+                                pending.put_nowait(node.path)
+                    except Exception as e:
+                        # A dead shell would fail every remaining listing; stop this worker so
+                        # lsConcurrent fails fast instead of silently dropping its share. The
+                        # directory is left unfinished so the queue cannot drain without it.
+                        if shell is not None and shell.returncode is not None:
+                            raise
+                        logging.error("Failed to list %s: %s", dirPath, e)
+                    pending.task_done()
+            finally:
+                if shell is not None:
+                    await self.closeShell(shell)
+
+        pending.put_nowait(path)
+        workers = [asyncio.create_task(worker(found)) for found in results]
+        # Workers only return by raising (e.g. their MEGAcmd shell failed to start), so wait for
+        # either the queue to drain or the first worker to die instead of joining blindly.
+        joined = asyncio.create_task(pending.join())
+        done, _ = await asyncio.wait([joined, *workers], return_when=asyncio.FIRST_COMPLETED)
+        for task in [joined, *workers]:
+            task.cancel()
+        await asyncio.gather(joined, *workers, return_exceptions=True)
+
+        for task in workers:
+            if task in done:
+                raise task.exception() or OSError("MEGA-LS worker stopped unexpectedly")
+
+        return [node for found in results for node in found]
+
     def getNewFolders(
         self: Self
     ) -> int:
@@ -340,33 +1006,119 @@ class MEGAsync():
             Number of folders created.
         """
         newFolders = 0
+        lastAddedFolder = None
 
         # Check all the nodes in the tree to see if there are any missing from the local.
-        for node in self.tree:
-            if node['type'] == 'd':  # Only check folders.
-                localNodePath = os.path.join(self.localRoot, node['path'])
-                if not os.path.exists(localNodePath):
-                    # Make sure a containing folder hasn't already been added.
-                    isNeeded = True
-                    for needNode in self.downloadNodes:
-                        if node['path'].startswith(needNode['path']):
-                            # A folder that contains the current node is already in the sync list.
-                            isNeeded = False
-                            break
-
-                    if isNeeded:
-                        logging.debug(f"Added new folder {node['path']}")
-                        self.downloadNodes.append(node)
-                        newFolders += 1
+        paths = self.tree.paths
+        for i, type in enumerate(self.tree.types):
+            if type == TYPE_FOLDER:  # Only check folders.
+                # The tree is sorted so a folder's subfolders directly follow it; skip them if the
+                # containing folder has already been added to the sync list.
+                path = paths[i]
+                if lastAddedFolder is not None and path.startswith(lastAddedFolder):
+                    continue
+
+                if path not in self.localDirs:
+                    logging.debug("Added new folder %s", path)
+                    self.downloadNodes.append(self.tree.node(i))
+                    lastAddedFolder = ''.join([path, '/'])
+                    newFolders += 1
 
         return newFolders
 
+    def snapshotLocal(
+        self: Self,
+    ) -> int:
+        """
+        snapshotLocal Index the size and mtime of every local node in a single directory sweep.
+
+        The index maps the path relative to the localRoot, using the same '/' separators as the
+        remote node paths, to a (size, mtime) tuple. The relative paths of all local directories
+        are also collected in localDirs.
+
+        Returns
+        -------
+        int
+            Number of local nodes indexed.
+        """
+        self.localIndex = {}
+        self.localDirs = set()
+        try:
+            rootStat = os.stat(self.localRoot)
+        except OSError:
+            logging.warning(f"Local path {self.localRoot} does not exist yet.")
+            return 0
+        self.localIndex[""] = (rootStat.st_size, rootStat.st_mtime)
+        self.localDirs.add("")
+
+        # Scan directories on a thread pool; the stat calls release the GIL, so slow disks and
+        # network shares can have many requests outstanding at once.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.maxScanners) as executor:
+            pending = {executor.submit(self.scanLocalDir, "", self.localRoot)}
+            while pending:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    for relPath, localPath, size, mtime, isDir, isLink in future.result():
+                        self.localIndex[relPath] = (size, mtime)
+                        if isDir:
+                            self.localDirs.add(relPath)
+                            # Like os.walk, don't descend into symlinked directories; a link to an
+                            # ancestor would otherwise be walked until ELOOP.
+                            if not isLink:
+                                pending.add(executor.submit(self.scanLocalDir, relPath, localPath))
+
+        return len(self.localIndex)
+
+    def scanLocalDir(
+        self: Self,
+        relDir: str,
+        localDir: str,
+    ) -> List[Tuple[str, str, int, float, bool, bool]]:
+        """
+        scanLocalDir Stat every entry of a single local directory.
+
+        Parameters
+        ----------
+        relDir : str
+            Path of the directory relative to the localRoot.
+        localDir : str
+            Full path of the directory.
+
+        Returns
+        -------
+        List[Tuple[str, str, int, float, bool, bool]]
+            (relative path, full path, size, mtime, is directory, is symlink) for each entry.
+        """
+        try:
+            entries = os.scandir(localDir)
+        except OSError as e:
+            logging.error("Unable to scan %s: %s", localDir, e)
+            return []
+
+        results = []
+        with entries:
+            for entry in entries:
+                relPath = '/'.join([relDir, entry.name]).lstrip('/')
+                try:
+                    # DirEntry caches the stat result from the directory read on Windows.
+                    entryStat = entry.stat()
+                    results.append((relPath, entry.path, entryStat.st_size, entryStat.st_mtime,
+                                    entry.is_dir(), entry.is_symlink()))
+                except OSError as e:
+                    logging.error("Unable to stat %s: %s", entry.path, e)
+
+        return results
+
     def filesToSync(
         self: Self,
     ) -> int:
         """
         filesToSync Compute which files from the remote need to be downloaded.
 
+        A local file of the same size as the remote one is assumed unchanged unless `strictMtime`
+        is set, in which case it is also replaced when the remote date is newer.
+
         Returns
         -------
         int
@@ -374,40 +1126,177 @@ class MEGAsync():
         """
         nSyncFiles = 0
 
-        for node in self.tree:
-            if node['type'] == '-':  # File
-                localPath = os.path.join(self.localRoot, node['path'])
-                localDir = os.path.dirname(localPath)
+        # Bind everything the loop touches to locals and walk the tree's columns together.
+        tree = self.tree
+        localDirs = self.localDirs
+        localIndex = self.localIndex
+        strictMtime = self.strictMtime
+        for i, (type, path, size, date) in enumerate(
+                zip(tree.types, tree.paths, tree.sizes, tree.dates)):
+            # Only check for single files that need to be downloaded; full folders are handled in
+            # the getNewFolders method.
+            if type != TYPE_FILE or path.rpartition('/')[0] not in localDirs:
+                continue
 
-                # Only check for single files that need to be downloaded; full folders are handled
-                # in the getNewFolders method.
-                if os.path.exists(localDir):
-                    if not os.path.exists(localPath):
-                        logging.debug(f"New download {node['path']}")
-                        self.downloadNodes.append(node)
-                        nSyncFiles += 1
+            localState = localIndex.get(path)
+            if localState is None:
+                logging.debug("New download %s", path)
+                self.downloadNodes.append(tree.node(i))
+                nSyncFiles += 1
+                continue
 
-                    else:  # Do we need to replace the file.
-                        isSameSize = (os.path.getsize(localPath) == node['size'])
-                        isRemoteNewer = (os.stat(localPath).st_mtime < node['date'])
+            # Do we need to replace the file.
+            localSize, localMtime = localState
+            # Only look at the dates when asked to; same-size files are almost always identical.
+            isSameSize = (localSize == size)
+            isRemoteNewer = strictMtime and (localMtime < date - MTIME_TOLERANCE)
 
-                        if (not isSameSize) or isRemoteNewer:
-                            logging.debug(f"Replace {node['path']}")
-                            self.replaceNodes.append(node)
-                            nSyncFiles += 1
+            if (not isSameSize) or isRemoteNewer:
+                logging.debug("Replace %s", path)
+                self.replaceNodes.append(tree.node(i))
+                nSyncFiles += 1
 
         return nSyncFiles
 
-    def queueDownloads(
+    def localTarget(
+        self: Self,
+        path: str,
+    ) -> str:
+        """
+        localTarget Local directory that MEGA-GET should download the remote path into.
+
+        Files in the same remote folder share a target, so it is computed once per folder.
+
+        Parameters
+        ----------
+        path : str
+            Path of the remote node relative to the remote URL provided.
+
+        Returns
+        -------
+        str
+            Full path of the local directory containing the node.
+        """
+        remoteDir = path.rpartition('/')[0]
+        target = self.localTargets.get(remoteDir)
+        if target is None:
+            target = os.path.join(self.localRoot, remoteDir).rstrip(r'\/')
+            self.localTargets[remoteDir] = target
+
+        return target
+
+    async def getNode(
+        self: Self,
+        node: Node,
+        semaphore: asyncio.BoundedSemaphore,
+    ) -> bool:
+        """
+        getNode Download a single node with the MEGA-GET cmdlet.
+
+        Parameters
+        ----------
+        node : Node
+            Remote node to download.
+        semaphore : asyncio.BoundedSemaphore
+            Limits the number of MEGA-GET processes running at once.
+
+        Returns
+        -------
+        bool
+            True if MEGA-GET exited successfully.
+        """
+        cmd = [
+            self.megaCmd["mega-get"], "-q",
+            node.path,
+            self.localTarget(node.path),
+            "--ignore-quota-warn",
+        ]
+        async with semaphore:
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug(' '.join(cmd))
+            p = await asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+            stdout, _ = await p.communicate()
+
+        if stdout:
+            logging.error(stdout.decode('utf-8', 'replace').rstrip())
+        if p.returncode:
+            logging.error("MEGA-GET failed with error code %s: %s",
+                          p.returncode, megaErrorMeaning(p.returncode))
+            return False
+
+        return True
+
+    def getNodesBatch(
+        self: Self,
+        nodes: List[Node],
+        chunkSize: int = 128,
+    ) -> int:
+        """
+        getNodesBatch Queue downloads for all nodes through a single MEGAcmd shell process.
+
+        Parameters
+        ----------
+        nodes : List[Node]
+            Remote nodes to download.
+        chunkSize : int, optional
+            Number of commands written to the shell between flushes, by default 128.
+
+        Returns
+        -------
+        int
+            Number of get commands sent to the shell. The shell does not report per-command
+            success, so failures are only counted from the error lines it prints.
+        """
+        cmd = [self.megaCmd["mega-cmd"]]
+        logging.debug(' '.join(cmd))
+        # The shell prints a prompt and status for every command. Its output goes to a temporary
+        # file so it can never fill a pipe and block our writes to stdin.
+        nSent = 0
+        with (tempfile.TemporaryFile() as outFile,
+              subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=outFile,
+                               stderr=subprocess.STDOUT) as pShell):
+            try:
+                for n, node in enumerate(nodes, start=1):
+                    line = (f'get -q "{node.path}" "{self.localTarget(node.path)}"'
+                            ' --ignore-quota-warn')
+                    logging.debug(line)
+                    pShell.stdin.write(''.join([line, '\n']).encode('utf-8'))
+                    nSent += 1
+                    if n % chunkSize == 0:
+                        pShell.stdin.flush()
+            except BrokenPipeError:
+                logging.error("MEGAcmd shell exited before all downloads were queued.")
+
+            # Closing stdin ends the shell session; queued transfers keep running in the server.
+            pShell.communicate()
+            outFile.seek(0)
+            output = outFile.read().decode('utf-8', 'replace')
+
+        if output:
+            logging.debug(output.rstrip())
+        nErrors = sum(1 for line in output.splitlines() if isShellError(line))
+        if nErrors:
+            logging.error(f"MEGAcmd shell reported {nErrors} errors while queueing downloads.")
+        if pShell.returncode:
+            logging.error(f"MEGAcmd shell exited with code {pShell.returncode}")
+
+        return nSent
+
+    async def queueDownloads(
         self: Self,
     ) -> int:
         """
         queueDownloads Assign all needed downloads to the MEGA-GET cmdlet.
 
+        Up to `maxDownloads` MEGA-GET processes are run concurrently, or all downloads are sent
+        through a single MEGAcmd shell if `batchDownloads` is set.
+
         Returns
         -------
         int
-            Number of downloads queued to MEGA-GET.
+            Number of downloads queued to MEGA-GET (with `batchDownloads`, the number of get
+            commands sent to the shell).
         """
 
         """Logic
@@ -420,53 +1309,35 @@ class MEGAsync():
         Add new folders to the MEGA-GET download queue.
           (mega-get -q $remotepath $localpath)
         """
-        newDownloads = 0
-
         # Prepare files to be replaced.
         tmpDir = os.path.join(self.localRoot, "_tmp")
-        if not os.path.exists(tmpDir):
-            logging.debug(f"Created directory {tmpDir}")
-            os.mkdir(tmpDir)
+        os.makedirs(tmpDir, exist_ok=True)
 
+        # Record nodes that are being replaced.
         with open(os.path.join(tmpDir, "_replace.log"), 'w') as f:
-            for node in self.replaceNodes:
-                # Record nodes that are being replaced.
-                logging.debug(f"Replace {node['path']}")
-                f.write(''.join([json.dumps(node), '\n']))
-
-                # Delete obsolete files.
-                os.remove(os.path.join(self.localRoot, node['path']))
-
-                # Add to the download queue.
-                self.downloadNodes.append(node)
-            logging.info(f"Added {len(self.replaceNodes)} nodes to downloadNodes list.")
-
-        # Add new nodes to the MEGA download queue.
-        for node in self.downloadNodes:
-            cmd = [
-                self.OSShell, "mega-get", "-q",
-                ''.join(['"', node['path'], '"']),
-                ''.join([
-                    '"',
-                    os.path.join(self.localRoot, os.path.dirname(node['path'])).rstrip(r'\/'),
-                    '"']),
-                "--ignore-quota-warn",
-            ]
-            logging.debug(' '.join(cmd))
-            p = subprocess.run(cmd, capture_output=True)
-            if p.stdout:
-                logging.error(p.stdout.decode('utf-8').rstrip())
-            if p.stderr:
-                logging.error(p.stderr.decode('utf-8').rstrip())
-            if p.returncode:
-                codeMeaning = (subprocess.run(["mega-errorcode", p.returncode], capture_output=True)
-                               .stdout.decode('utf-8').strip())
-                logging.error(f"MEGA-GET failed with error code {p.returncode}: {codeMeaning}")
-                continue
-
-            newDownloads += 1
+            f.writelines([''.join([json.dumps(node.toDict()), '\n']) for node in self.replaceNodes])
+
+        # Delete obsolete files. The unlinks are independent, so they run on a thread pool to hide
+        # their latency on network drives.
+        obsoletePaths = [os.path.join(self.localRoot, node.path) for node in self.replaceNodes]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.maxScanners) as pool:
+            for _ in pool.map(os.remove, obsoletePaths):
+                pass
+
+        # Add to the download queue.
+        self.downloadNodes.extend(self.replaceNodes)
+        logging.info(f"Added {len(self.replaceNodes)} nodes to downloadNodes list.")
+
+        if self.batchDownloads:
+            return await asyncio.to_thread(self.getNodesBatch, self.downloadNodes)
+
+        # Add new nodes to the MEGA download queue, running a bounded number at once.
+        semaphore = asyncio.BoundedSemaphore(self.maxDownloads)
+        results = await asyncio.gather(*[
+            self.getNode(node, semaphore) for node in self.downloadNodes
+        ])
 
-        return newDownloads
+        return sum(results)
 
     def logout(
         self: Self,
@@ -479,20 +1350,21 @@ class MEGAsync():
         int
             Return code of the MEGA-LOGOUT cmdlet process (0 is success).
         """
-        cmd = [self.OSShell, "mega-logout"]
+        cmd = [self.megaCmd["mega-logout"]]
         logging.debug(' '.join(cmd))
-        pLogout = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-
-        for line in iter(pLogout.stdout.readline, b''):
-            logging.info(line.decode('utf-8').rstrip())
-        pLogout.stdout.close()
-        pLogout.wait()
+        output = []
+        # Logout messages are only logged, so a stray non-UTF-8 byte must not abort the run.
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              encoding='utf-8', errors='replace') as pLogout:
+            # Block on the pipe until the process closes it rather than polling.
+            for line in pLogout.stdout:
+                logging.info(line.rstrip())
+                output.append(line)
+            pLogout.wait()
 
         if pLogout.returncode:
-            logging.critical(pLogout.stdout.decode('utf-8'))
-            pError = subprocess.run([self.OSShell, "mega-errorcode", pLogout.returncode],
-                                    capture_output=True)
-            logging.critical(pError.stdout.decode('utf-8'))
+            logging.critical(''.join(output).rstrip())
+            logging.critical(megaErrorMeaning(pLogout.returncode))
 
         return pLogout.returncode
 
@@ -519,6 +1391,11 @@ class MEGAsync():
         nNodes = self.getRemoteTree()
         logging.info(f"Encountered {nNodes} remote nodes.")
 
+        # Index the local tree once so the comparisons below don't need further syscalls.
+        logging.warning("Indexing local tree.")
+        nLocalNodes = self.snapshotLocal()
+        logging.info(f"Encountered {nLocalNodes} local nodes.")
+
         # Get the list of all the new folders to be downloaded.
         logging.warning("Collecting full folders to be downloaded.")
         nNewFolders = self.getNewFolders()
@@ -533,15 +1410,27 @@ class MEGAsync():
 
         # Download all missing/old files.
         logging.warning("Queueing all downloads.")
-        nNewDownloads = self.queueDownloads()
+        nNewDownloads = asyncio.run(self.queueDownloads())
 
         if nNewDownloads:
-            logging.warning(f"Queued {nNewDownloads} with MEGA-GET.")
+            logging.warning(f"Sent {nNewDownloads} downloads to MEGA-GET.")
             logging.warning("Please use MEGA-TRANSFERS to view the ongoing downloads.")
 
         return True
 
 
+def intAtLeast(minimum: int):
+    """Build an argparse type that accepts integers no smaller than minimum."""
+    def convert(value: str) -> int:
+        number = int(value)
+        if number < minimum:
+            raise argparse.ArgumentTypeError(f"must be at least {minimum}, got {number}")
+        return number
+
+    convert.__name__ = "int"  # argparse names the type in "invalid int value" errors.
+    return convert
+
+
 if __name__ == "__main__":
     # Read command line.
     parser = argparse.ArgumentParser(
@@ -556,12 +1445,44 @@ if __name__ == "__main__":
         '-l', '--local', help="File path to sync the remote files to", required=True,
         default=r"D:\3D Printing\Games\Dungeons and Dragons\Minis\MZ4250 3D Miniatures Models"
         )
+    parser.add_argument(
+        '--cache-ttl', type=float, help="Seconds to reuse cached remote listings", default=3600
+    )
+    parser.add_argument(
+        '--no-cache', action='store_true', help="Always list the remote folder"
+    )
+    parser.add_argument(
+        '-j', '--downloads', type=intAtLeast(1),
+        help="Number of MEGA-GET processes to run at once",
+        default=6
+    )
+    parser.add_argument(
+        '--listings', type=intAtLeast(0), default=0,
+        help="List the remote with this many concurrent MEGA-LS processes (0: one recursive call)"
+    )
+    parser.add_argument(
+        '--shell', action='store_true',
+        help="Run concurrent listings through one MEGAcmd shell per worker (see --listings)"
+    )
+    parser.add_argument(
+        '--batch', action='store_true', help="Queue all downloads through one MEGAcmd shell"
+    )
+    parser.add_argument(
+        '--strict', action='store_true',
+        help="Also replace files of the same size when the remote copy is newer"
+    )
     parser.add_argument(
         '-v', '--verbose', action='count', help="Expanded console logging", default=0
     )
     args = parser.parse_args()
     folder_url = args.remote
     dest_path = args.local
+    cacheTTL = 0 if args.no_cache else args.cache_ttl
+    maxDownloads = args.downloads
+    maxListings = args.listings
+    persistentShell = args.shell
+    batchDownloads = args.batch
+    strictMtime = args.strict
     verbose = args.verbose
 
     # Start logging.
@@ -593,10 +1514,25 @@ if __name__ == "__main__":
 
     logging.debug(f"{folder_url=}")
     logging.debug(f"{dest_path=}")
+    logging.debug(f"{cacheTTL=}")
+    logging.debug(f"{maxDownloads=}")
+    logging.debug(f"{maxListings=}")
+    logging.debug(f"{persistentShell=}")
+    logging.debug(f"{batchDownloads=}")
+    logging.debug(f"{strictMtime=}")
     logging.debug(f"{verbose=}")
 
     # Run the scraper.
-    sync = MEGAsync(folder_url, dest_path)
+    sync = MEGAsync(
+        folder_url,
+        dest_path,
+        maxDownloads=maxDownloads,
+        maxListings=maxListings,
+        cacheTTL=cacheTTL,
+        batchDownloads=batchDownloads,
+        persistentShell=persistentShell,
+        strictMtime=strictMtime,
+    )
     logging.info(f"Initialized with remotePath: {sync.remoteRoot}; localPath: {sync.localRoot}")
     try:
         sync.sync()
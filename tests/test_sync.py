@@ -0,0 +1,300 @@
+import asyncio
+import os
+
+import pytest
+
+import sync
+
+
+@pytest.fixture
+def megaSync(tmp_path):
+    return sync.MEGAsync("https://mega.nz/folder/test", str(tmp_path))
+
+
+def folder(path):
+    return sync.Node(type='d', size=0, date=0, name=path.rpartition('/')[2], path=path)
+
+
+def file(path, size=1):
+    return sync.Node(type='-', size=size, date=0, name=path.rpartition('/')[2], path=path)
+
+
+def test_depthFirst_keeps_folder_contents_together():
+    # Plain string order would put "a-x" between "a" and "a/c".
+    nodes = [file("a-x/g"), folder("a/c"), folder("a-x"), file("a/c/f"), folder("a")]
+    ordered = sync.RemoteTree.depthFirst(nodes)
+    assert [node.path for node in ordered] == ["a", "a/c", "a/c/f", "a-x", "a-x/g"]
+
+
+def test_depthFirst_lists_contents_of_duplicate_folders_once(caplog):
+    nodes = [folder("a"), folder("a"), file("a/f")]
+    ordered = sync.RemoteTree.depthFirst(nodes)
+    assert [node.path for node in ordered] == ["a", "a/f", "a"]
+    assert "no listed folder" not in caplog.text
+
+
+def test_depthFirst_falls_back_on_orphans(caplog):
+    nodes = [file("b/g"), folder("a"), file("a/f")]
+    ordered = sync.RemoteTree.depthFirst(nodes)
+    assert [node.path for node in ordered] == ["a", "a/f", "b/g"]
+    assert "1 remote nodes have no listed folder" in caplog.text
+
+
+def test_getNewFolders_skips_descendants_of_missing_folders(megaSync):
+    nodes = [folder("a"), folder("a/c"), folder("a-x"), folder("b"), folder("b/d")]
+    megaSync.tree = sync.RemoteTree(sync.RemoteTree.depthFirst(nodes))
+    megaSync.localDirs = {"", "b"}
+    assert megaSync.getNewFolders() == 3
+    assert [node.path for node in megaSync.downloadNodes] == ["a", "a-x", "b/d"]
+
+
+def localFile(tmp_path, path, size, mtime=1_000_000):
+    fullPath = tmp_path / path
+    fullPath.write_bytes(b"x" * size)
+    os.utime(fullPath, (mtime, mtime))
+
+
+@pytest.mark.parametrize("strictMtime, replaced", [
+    (False, ["bigger.txt"]),
+    (True, ["bigger.txt", "newer.txt"]),
+])
+def test_filesToSync(tmp_path, strictMtime, replaced):
+    localFile(tmp_path, "same.txt", 3)
+    localFile(tmp_path, "bigger.txt", 3)
+    localFile(tmp_path, "newer.txt", 3)
+    localFile(tmp_path, "within_tolerance.txt", 3)
+    megaSync = sync.MEGAsync("url", str(tmp_path), strictMtime=strictMtime)
+    megaSync.snapshotLocal()
+
+    nodes = [
+        sync.Node(type='-', size=3, date=1_000_000, name="same.txt", path="same.txt"),
+        sync.Node(type='-', size=5, date=1_000_000, name="bigger.txt", path="bigger.txt"),
+        sync.Node(type='-', size=3, date=1_000_010, name="newer.txt", path="newer.txt"),
+        sync.Node(type='-', size=3, date=1_000_000 + sync.MTIME_TOLERANCE,
+                  name="within_tolerance.txt", path="within_tolerance.txt"),
+        file("new.txt"),
+        folder("missing"),
+        file("missing/f"),  # Downloaded along with its folder by getNewFolders.
+    ]
+    megaSync.tree = sync.RemoteTree(sync.RemoteTree.depthFirst(nodes))
+
+    assert megaSync.filesToSync() == 1 + len(replaced)
+    assert [node.path for node in megaSync.downloadNodes] == ["new.txt"]
+    assert sorted(node.path for node in megaSync.replaceNodes) == replaced
+
+
+def test_snapshotLocal_does_not_follow_symlinked_folders(tmp_path):
+    (tmp_path / "a").mkdir()
+    localFile(tmp_path, "a/f", 1)
+    try:
+        os.symlink(tmp_path, tmp_path / "a" / "loop", target_is_directory=True)
+    except OSError:
+        pytest.skip("symlinks are not available")
+
+    megaSync = sync.MEGAsync("url", str(tmp_path))
+    assert megaSync.snapshotLocal() == 4
+    assert set(megaSync.localIndex) == {"", "a", "a/f", "a/loop"}
+    assert megaSync.localDirs == {"", "a", "a/loop"}
+
+
+def test_remoteTree_node_round_trips_all_fields():
+    node = sync.Node(type='-', size=5, date=7, name="x", path="a/x",
+                     export='e', export_duration='p', shared='s', version=3)
+    assert sync.RemoteTree([node]).node(0) == node
+
+
+def test_parseLsLine_file(megaSync):
+    line = "-ep-   12  123456789 2023-01-31T12:00:00 some file.stl\r\n"
+    node = megaSync.parseLsLine("dir/sub", line)
+    assert node.type == '-'
+    assert (node.export, node.export_duration, node.shared) == ('e', 'p', '-')
+    assert node.version == 12
+    assert node.size == 123456789
+    assert node.date == sync.parseMegaDate("2023-01-31T12:00:00")
+    assert node.name == "some file.stl"
+    assert node.path == "dir/sub/some file.stl"
+
+
+def test_parseLsLine_folder_at_root(megaSync):
+    node = megaSync.parseLsLine("", "d---    -          - 2023-01-31T12:00:00 my dir\n")
+    assert (node.type, node.version, node.size, node.path) == ('d', 0, 0, "my dir")
+
+
+@pytest.mark.parametrize("line", [
+    "FLAGS VERS SIZE DATE NAME\n",
+    "\n",
+    "/Root/my dir:\n",
+    "-ep- garbage\n",
+])
+def test_parseLsLine_rejects_non_nodes(megaSync, line):
+    assert megaSync.parseLsLine("", line) is None
+
+
+@pytest.mark.parametrize("code, meaning", [
+    (0, "Everything OK"),
+    (203, "Resource not found"),  # -53 as reported by POSIX.
+    (4294967243, "Resource not found"),  # -53 as reported by Windows.
+    (5, "Unknown MEGA error 5"),
+    (-9, "Killed by signal SIGKILL"),
+])
+def test_megaErrorMeaning(code, meaning):
+    assert sync.megaErrorMeaning(code) == meaning
+
+
+@pytest.mark.parametrize("useOrjson", [False, True])
+def test_cache_round_trip(tmp_path, monkeypatch, useOrjson):
+    if useOrjson:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(sync, "orjson", None)
+
+    nodes = [folder("a"), file("a/f", size=42)]
+    writer = sync.MEGAsync("url", str(tmp_path))
+    writer.cachePut("-r /", nodes)
+    writer.saveCache()
+
+    reader = sync.MEGAsync("url", str(tmp_path))
+    assert reader.loadCache() == 1
+    assert reader.cacheGet("-r /") == nodes
+
+
+@pytest.mark.parametrize("content", [
+    b"[]",
+    b'{"remoteRoot": "https://mega.nz/folder/test", "listings": []}',
+    b'{"remoteRoot": "https://mega.nz/folder/test", "listings": {"/": []}}',
+    b'{"remoteRoot": "https://mega.nz/folder/test", "listings": {"/": {"ts": "now", "nodes": []}}}',
+    b'{"remoteRoot": "https://mega.nz/folder/test", "listings": {"/": {"ts": 1, "nodes": [1]}}}',
+])
+def test_loadCache_ignores_malformed_cache(megaSync, content):
+    os.makedirs(os.path.dirname(megaSync.cachePath))
+    with open(megaSync.cachePath, 'wb') as f:
+        f.write(content)
+    assert megaSync.loadCache() == 0
+    assert megaSync.cacheGet("/") is None
+
+
+def test_loadCache_ignores_other_remote_folder(tmp_path):
+    writer = sync.MEGAsync("https://mega.nz/folder/one", str(tmp_path))
+    writer.cachePut("/", [file("f")])
+    writer.saveCache()
+
+    assert sync.MEGAsync("https://mega.nz/folder/one", str(tmp_path)).loadCache() == 1
+    assert sync.MEGAsync("https://mega.nz/folder/two", str(tmp_path)).loadCache() == 0
+
+
+def test_cacheGet_drops_listing_with_unknown_fields(megaSync):
+    megaSync.cache = {"/": {"ts": sync.time.time(), "nodes": [{"bogus": 1}]}}
+    assert megaSync.cacheGet("/") is None
+    assert megaSync.cache == {}
+
+
+def test_cache_expires_after_ttl(megaSync, monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(sync.time, "time", lambda: now)
+    megaSync.cachePut("/", [file("f")])
+    assert megaSync.cacheGet("/") is not None
+
+    now += megaSync.cacheTTL
+    assert megaSync.cacheGet("/") is None
+
+
+def test_saveCache_drops_least_recently_used(tmp_path):
+    writer = sync.MEGAsync("url", str(tmp_path), cacheSize=2)
+    for key in ["a", "b", "c"]:
+        writer.cachePut(key, [file(key)])
+    writer.cacheGet("a")  # "b" is now the least recently used.
+    writer.saveCache()
+
+    reader = sync.MEGAsync("url", str(tmp_path))
+    reader.loadCache()
+    assert set(reader.cache) == {"c", "a"}
+
+
+class FakeShell():
+    """Stands in for an asyncio MEGAcmd shell process, replaying canned output lines."""
+    def __init__(self, lines):
+        self.returncode = None
+        self.written = []
+        self.lines = [line.encode('utf-8') for line in lines]
+        self.stdin = self
+        self.stdout = self
+
+    def write(self, data):
+        self.written.append(data.decode('utf-8'))
+
+    async def drain(self):
+        pass
+
+    async def readline(self):
+        if self.lines:
+            return self.lines.pop(0)
+        self.returncode = 1  # Out of output: the shell has exited.
+        return b""
+
+    async def wait(self):
+        return self.returncode
+
+
+def test_shellCommand_stops_at_sentinel(megaSync):
+    shell = FakeShell([
+        "MEGA CMD> ls -l \"a\"\n",
+        "FLAGS VERS SIZE DATE NAME\n",
+        f"MEGA CMD> echo {sync.SHELL_SENTINEL}\n",  # The shell echoing our command back.
+        f"MEGA CMD> {sync.SHELL_SENTINEL}\n",
+        "output of the next command\n",
+    ])
+    lines = asyncio.run(megaSync.shellCommand(shell, 'ls -l "a"'))
+    assert lines == ['MEGA CMD> ls -l "a"', "FLAGS VERS SIZE DATE NAME"]
+    assert shell.written == [f'ls -l "a"\necho {sync.SHELL_SENTINEL}\n']
+
+
+def test_shellCommand_raises_when_shell_exits(megaSync):
+    with pytest.raises(OSError):
+        asyncio.run(megaSync.shellCommand(FakeShell(["partial\n"]), "ls"))
+
+
+@pytest.mark.parametrize("line, isError", [
+    ("[API:err: 12:00:00] Couldn't find \"a\"", True),
+    ("MEGA CMD> [API:err: 12:00:00] Couldn't find \"a\"", True),
+    ("[err: 12:00:00] Not logged in", True),
+    ("-ep-    1      12345 2023-01-31T12:00:00 [error] notes.txt", False),
+    ("MEGA CMD> ", False),
+])
+def test_isShellError(line, isError):
+    assert sync.isShellError(line) is isError
+
+
+def test_lsAsync_raises_on_error_after_prompt(megaSync):
+    shell = FakeShell([
+        "MEGA CMD> [API:err: 12:00:00] Couldn't find \"a\"\n",
+        f"MEGA CMD> {sync.SHELL_SENTINEL}\n",
+    ])
+    with pytest.raises(OSError):
+        asyncio.run(megaSync.lsAsync("a", shell))
+    assert megaSync.cacheGet("a") is None
+
+
+def test_lsConcurrent_fails_fast_when_shell_dies(megaSync, monkeypatch):
+    async def openShell():
+        return FakeShell([])  # Exits before answering the first listing.
+
+    async def closeShell(shell):
+        pass
+
+    monkeypatch.setattr(megaSync, "openShell", openShell)
+    monkeypatch.setattr(megaSync, "closeShell", closeShell)
+    megaSync.maxListings = 2
+    megaSync.persistentShell = True
+    with pytest.raises(OSError, match="MEGAcmd shell exited"):
+        asyncio.run(asyncio.wait_for(megaSync.lsConcurrent("/"), 5))
+
+
+def test_lsConcurrent_fails_fast_when_shell_cannot_start(megaSync, monkeypatch):
+    async def openShell():
+        raise OSError("mega-cmd not found")
+
+    monkeypatch.setattr(megaSync, "openShell", openShell)
+    megaSync.maxListings = 2
+    megaSync.persistentShell = True
+    with pytest.raises(OSError, match="mega-cmd not found"):
+        asyncio.run(asyncio.wait_for(megaSync.lsConcurrent("/"), 5))